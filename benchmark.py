@@ -0,0 +1,489 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# main.py import paytida Bot yaratadi - token formati to'g'ri bo'lishi kerak
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+
+import main
+
+
+def make_input(path, seconds, codec_args):
+    # Sinov fayli: stereo 44.1 kHz sinus signal
+    subprocess.run(
+        [main.FFMPEG_BIN, "-nostdin", "-y", "-v", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+         "-ac", "2"] + codec_args + [path],
+        check=True,
+    )
+
+
+def run_isolated(backend, in_path, out_path, fmt, codec=None):
+    # ffmpeg backendi: ffmpeg jarayonining o'zi o'lchanadi (Python va `import main` ~130 MB / bir necha
+    # soniya - natijaga kirmaydi). pydub Python ichida ishlaydi: jarayon o'lchanib, bazaviy qiymat ayriladi
+    if backend == "ffmpeg":
+        result = measure(main.ffmpeg_command(in_path, out_path, fmt, {"codec": codec}))
+    else:
+        cmd = [sys.executable, __file__, "_job", backend, in_path, out_path, fmt]
+        if codec: cmd += ["--codec", codec]
+        result = minus_baseline(measure(cmd))
+    if result is None:
+        raise RuntimeError(f"{backend}/{fmt} muvaffaqiyatsiz")
+    result["out_bytes"] = os.path.getsize(out_path)
+    return result
+
+
+# Fork qilingan bola ota jarayonning RSS cho'qqisini meros oladi (exec dan keyin ham ru_maxrss da qoladi):
+# `import main` qilgan jarayondan ishga tushirilgan ffmpeg ~130 MB ko'rsatadi. Shuning uchun o'lchov
+# main'ni import qilmagan kichik runner (python -I -S) orqali - uning o'zi bir necha MB
+MEASURE_RUNNER = """
+import json, os, subprocess, sys, time
+started = time.perf_counter()
+proc = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL)
+_, status, usage = os.wait4(proc.pid, 0)
+print(json.dumps([os.waitstatus_to_exitcode(status), time.perf_counter() - started,
+                  usage.ru_maxrss, usage.ru_utime + usage.ru_stime]))
+"""
+
+
+def measure(cmd):
+    out = subprocess.run([sys.executable, "-I", "-S", "-c", MEASURE_RUNNER] + cmd,
+                         stdout=subprocess.PIPE, check=True).stdout
+    code, wall, maxrss, cpu = json.loads(out)
+    if code != 0:
+        return None
+    # Linuxda ru_maxrss kilobaytda; kutilgan ffmpeg bolalari ham hisobga olinadi
+    return {"wall_s": round(wall, 3), "peak_rss_mb": round(maxrss / 1024, 1), "cpu_s": round(cpu, 3)}
+
+
+_BASELINE = {}
+
+
+def python_baseline():
+    # Konvertatsiyasiz `python benchmark.py _baseline`: interpretator + `import main` narxi (bir marta)
+    if not _BASELINE:
+        _BASELINE.update(measure([sys.executable, __file__, "_baseline"]))
+    return _BASELINE
+
+
+def minus_baseline(result):
+    if result is None: return None
+    base = python_baseline()
+    return {k: round(max(v - base[k], 0), 3) for k, v in result.items()}
+
+
+def cmd_job(args):
+    main.CONVERT_BACKEND = args.backend
+    func, job_args = main.conversion_task(args.in_path, args.out_path, args.fmt, {"codec": args.codec})
+    func(*job_args)
+
+
+def cmd_batch_job(args):
+    main.CONVERT_BACKEND = args.backend
+    outputs = [(os.path.join(args.out_dir, f"out.{main.FORMAT_EXTENSIONS[f]}"), f) for f in args.formats]
+    func, job_args = main.conversion_many_task(args.in_path, outputs, {"codec": args.codec})
+    func(*job_args)
+
+
+def cmd_batch(args):
+    # N ta alohida konvertatsiya va bitta ko'p chiqishli konvertatsiyani solishtirish
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path = os.path.join(tmp, "in.mp3")
+        for seconds in args.durations:
+            make_input(in_path, seconds, ["-c:a", "libmp3lame"])
+            for backend in args.backends:
+                separate = {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0}
+                for fmt in args.formats:
+                    out_path = os.path.join(tmp, f"out.{main.FORMAT_EXTENSIONS[fmt]}")
+                    row = run_isolated(backend, in_path, out_path, fmt, "mp3")
+                    separate["wall_s"] += row["wall_s"]
+                    separate["cpu_s"] += row["cpu_s"]
+                    separate["peak_rss_mb"] = max(separate["peak_rss_mb"], row["peak_rss_mb"])
+                # ffmpeg: bitta ko'p chiqishli ffmpeg jarayoni (alohidalar ham faqat ffmpeg - Python startapi yo'q)
+                if backend == "ffmpeg":
+                    outputs = [(os.path.join(tmp, f"out.{main.FORMAT_EXTENSIONS[f]}"), f) for f in args.formats]
+                    batch = measure(main.ffmpeg_multi_command(in_path, outputs, {"codec": "mp3"}))
+                else:
+                    batch = minus_baseline(measure([sys.executable, __file__, "_batch", backend, in_path, tmp,
+                                                    "--codec", "mp3", "--formats"] + args.formats))
+                if batch is None:
+                    raise RuntimeError(f"{backend} batch muvaffaqiyatsiz")
+                results.append({"duration_s": seconds, "backend": backend, "formats": args.formats,
+                                "separate": {k: round(v, 3) for k, v in separate.items()}, "batch": batch})
+    print(json.dumps({"benchmark": "batch", "python_baseline": _BASELINE or None, "results": results}, indent=2))
+
+
+def cmd_transcode(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = {
+            "wav": (os.path.join(tmp, "in.wav"), ["-c:a", "pcm_s16le"], "pcm_s16le"),
+            "mp3": (os.path.join(tmp, "in.mp3"), ["-c:a", "libmp3lame"], "mp3"),
+        }
+        for name in args.inputs:
+            path, codec_args, codec = inputs[name]
+            for seconds in args.durations:
+                make_input(path, seconds, codec_args)
+                for fmt in args.formats:
+                    for backend in args.backends:
+                        out_path = os.path.join(tmp, f"out_{backend}.{main.FORMAT_EXTENSIONS[fmt]}")
+                        row = {"input": name, "duration_s": seconds, "format": fmt, "backend": backend}
+                        row.update(run_isolated(backend, path, out_path, fmt, codec))
+                        results.append(row)
+                        os.remove(out_path)
+    # pydub qatorlari shu bazaviy qiymatsiz; ffmpeg qatorlari - faqat ffmpeg jarayoni
+    print(json.dumps({"benchmark": "transcode", "python_baseline": _BASELINE or None, "results": results}, indent=2))
+
+
+class LegacyFlood:
+    # Eski SecurityMiddleware mantig'i: har bir xabarda ro'yxat qayta quriladi
+    def __init__(self, limit, window):
+        self.limit, self.window, self.activity = limit, window, {}
+
+    def hit(self, user_id, now):
+        history = [t for t in self.activity.get(user_id, []) if now - t < self.window]
+        history.append(now)
+        self.activity[user_id] = history
+        return len(history) > self.limit
+
+
+def cmd_flood(args):
+    rng = random.Random(42)
+    # Sintetik oqim: ko'p foydalanuvchi + bir nechta hujumchi, vaqt virtual (xabarlar oralig'i bir xil)
+    attackers = list(range(args.attackers))
+    events = [rng.choice(attackers) if rng.random() < 0.2 else rng.randrange(args.attackers, args.users)
+              for _ in range(args.messages)]
+    step = args.duration / args.messages
+
+    results = []
+    detectors = {
+        "legacy": lambda: LegacyFlood(main.FLOOD_LIMIT, main.FLOOD_WINDOW),
+        "flood_detector": lambda: main.FloodDetector(main.FLOOD_LIMIT, main.FLOOD_WINDOW,
+                                                     args.capacity, main.FLOOD_SWEEP_INTERVAL),
+    }
+    for name, factory in detectors.items():
+        # 1-o'tish: vaqt (tracemalloc'siz), 2-o'tish: xotira
+        detector = factory()
+        flagged = 0
+        started = time.perf_counter()
+        for i, user_id in enumerate(events):
+            flagged += detector.hit(user_id, i * step)
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        detector = factory()
+        for i, user_id in enumerate(events):
+            detector.hit(user_id, i * step)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({"detector": name, "ns_per_message": round(elapsed / len(events) * 1e9),
+                        "flagged": flagged, "memory_mb": round(current / 1024 ** 2, 2),
+                        "peak_memory_mb": round(peak / 1024 ** 2, 2)})
+    print(json.dumps({"benchmark": "flood", "users": args.users, "messages": args.messages,
+                      "results": results}, indent=2))
+
+
+# --- HANDLER BENCHMARKI (soxta Bot API + lokal Postgres) ---
+
+def percentile(values, q):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+def cold_start(runs):
+    # Toza jarayonda "import main" vaqti va asosiy kutubxonalarning import ulushi
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    totals, libs = [], {"aiogram": [], "pydub": [], "asyncpg": []}
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore", "-c", code],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        totals.append(float(proc.stdout.strip().splitlines()[-1]))
+        for line in proc.stderr.splitlines():
+            # "import time:   self [us] | cumulative | imported package"
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] in libs:
+                libs[parts[2]].append(int(parts[1]) / 1e6)
+    return {"import_main_s": {"p50": round(percentile(totals, 50), 3), "max": round(max(totals), 3)},
+            "libraries_s": {k: round(percentile(v, 50), 3) for k, v in libs.items() if v}}
+
+
+class FakeBotAPI:
+    # Telegram Bot API o'rnini bosuvchi minimal server: javoblar shabloni, fayllar lokal diskdan
+    def __init__(self, files):
+        self.files = files # file_id -> lokal yo'l
+        self.ids = itertools.count(1)
+        self.runner = None
+        self.url = None
+
+    def _message(self, chat_id, **extra):
+        msg = {"message_id": next(self.ids), "date": int(time.time()),
+               "chat": {"id": int(chat_id or 0), "type": "private"}}
+        msg.update(extra)
+        return msg
+
+    async def handle(self, request):
+        from aiohttp import web
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+        chat_id = data.get("chat_id")
+        uid = f"r{next(self.ids)}"
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method == "getFile":
+            result = {"file_id": data["file_id"], "file_unique_id": data["file_id"], "file_path": data["file_id"]}
+        elif method == "sendAudio":
+            result = self._message(chat_id, audio={"file_id": uid, "file_unique_id": uid, "duration": 0})
+        elif method == "sendDocument":
+            result = self._message(chat_id, document={"file_id": uid, "file_unique_id": uid})
+        elif method == "sendMediaGroup":
+            count = len(json.loads(data.get("media", "[]")))
+            result = [self._message(chat_id, document={"file_id": f"{uid}_{i}", "file_unique_id": f"{uid}_{i}"})
+                      for i in range(count)]
+        elif method in ("sendMessage", "editMessageText", "copyMessage", "sendInvoice"):
+            result = self._message(chat_id, text=data.get("text", ""))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request):
+        from aiohttp import web
+        return web.FileResponse(self.files[request.match_info["path"].split("/")[-1]])
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class HandlerDriver:
+    # Dispatcherga sintetik update'lar yuborib, har bir handler kechikishini o'lchaydi
+    def __init__(self, base_user_id):
+        self.user_ids = itertools.count(base_user_id)
+        self.update_ids = itertools.count(1)
+        self.latency = {}
+
+    async def feed(self, name, payload):
+        from aiogram.types import Update
+        update = Update.model_validate({"update_id": next(self.update_ids), **payload}, context={"bot": main.bot})
+        started = time.perf_counter()
+        await main.dp.feed_update(main.bot, update)
+        self.latency.setdefault(name, []).append(time.perf_counter() - started)
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"bench{uid}"}
+
+    def _message(self, uid, **extra):
+        return {"message_id": next(self.update_ids), "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"}, "from": self._user(uid), **extra}
+
+    async def text(self, name, uid, text):
+        await self.feed(name, {"message": self._message(uid, text=text)})
+
+    async def audio(self, uid, file_id, duration):
+        audio = {"file_id": file_id, "file_unique_id": file_id, "duration": duration,
+                 "mime_type": "audio/mpeg", "file_name": "bench.mp3"}
+        await self.feed("get_file", {"message": self._message(uid, audio=audio)})
+
+    async def callback(self, name, uid, data):
+        message = self._message(uid, text="Formatni tanlang:")
+        message["from"] = {"id": 1, "is_bot": True, "first_name": "bench"}
+        await self.feed(name, {"callback_query": {"id": str(next(self.update_ids)), "from": self._user(uid),
+                                                  "chat_instance": "bench", "data": data, "message": message}})
+
+    async def conversion(self, file_id, duration, fmt):
+        uid = next(self.user_ids)
+        await self.text("start", uid, "/start")
+        await self.text("stats", uid, "📊 Statistika")
+        await self.text("buy_menu", uid, "🌟 Obuna olish")
+        await self.text("req_audio", uid, "🎵 Konvertatsiya")
+        await self.audio(uid, file_id, duration)
+        await self.callback(f"process_{fmt}", uid, f"fmt_{fmt}")
+
+
+async def cleanup_bench_rows(conn, base_user_id, started_day):
+    # Sintetik foydalanuvchilar va ularning analitikasi: rollup jadvallardan ham ayiramiz,
+    # aks holda admin statistikasi benchmark konvertatsiyalari bilan to'lib qoladi
+    async with conn.transaction():
+        await conn.execute("""
+            UPDATE daily_format_stats s SET conversions = s.conversions - x.n, cached = s.cached - x.cached,
+                duration_total = s.duration_total - x.duration, encode_ms_total = s.encode_ms_total - x.encode_ms,
+                bytes_out = s.bytes_out - x.bytes_out
+            FROM (SELECT created_at::date AS day, fmt, COUNT(*) AS n, COUNT(*) FILTER (WHERE cached) AS cached,
+                         SUM(COALESCE(duration, 0)) AS duration, SUM(COALESCE(encode_ms, 0)) AS encode_ms,
+                         SUM(COALESCE(bytes_out, 0)) AS bytes_out
+                  FROM conversions WHERE telegram_id >= $1 GROUP BY 1, 2) x
+            WHERE s.day = x.day AND s.fmt = x.fmt
+        """, base_user_id)
+        await conn.execute("""
+            UPDATE daily_stats d SET conversions = d.conversions - x.n,
+                bytes_in = d.bytes_in - x.bytes_in, bytes_out = d.bytes_out - x.bytes_out
+            FROM (SELECT created_at::date AS day, COUNT(*) AS n, SUM(COALESCE(bytes_in, 0)) AS bytes_in,
+                         SUM(COALESCE(bytes_out, 0)) AS bytes_out
+                  FROM conversions WHERE telegram_id >= $1 GROUP BY 1) x
+            WHERE d.day = x.day
+        """, base_user_id)
+        # Ro'yxatdan o'tgan kun saqlanmaydi: birinchi konvertatsiya kuni, bo'lmasa benchmark boshlangan kun
+        await conn.execute("""
+            UPDATE daily_stats d SET new_users = GREATEST(d.new_users - x.n, 0)
+            FROM (SELECT COALESCE(c.day, $2) AS day, COUNT(*) AS n FROM users u
+                  LEFT JOIN (SELECT telegram_id, MIN(created_at)::date AS day FROM conversions
+                             WHERE telegram_id >= $1 GROUP BY 1) c USING (telegram_id)
+                  WHERE u.telegram_id >= $1 GROUP BY 1) x
+            WHERE d.day = x.day
+        """, base_user_id, started_day)
+        await conn.execute("DELETE FROM conversions WHERE telegram_id >= $1", base_user_id)
+        await conn.execute("DELETE FROM result_cache WHERE file_unique_id LIKE 'bench_%'")
+        await conn.execute("DELETE FROM users WHERE telegram_id >= $1", base_user_id)
+
+
+async def run_handlers(args, tmp):
+    base_user_id = 9_000_000_000
+    # Sintetik foydalanuvchilar limit va flood himoyasiga urilmasligi uchun
+    for tier in main.LIMITS: main.LIMITS[tier].update(daily=10 ** 6, duration=10 ** 5)
+    main.FLOOD_DETECTOR = main.FloodDetector(1, 0, 16, 60) # Oyna 0 - hech bir xabar oyna ichiga tushmaydi
+
+    files = {}
+    for seconds in args.durations:
+        path = os.path.join(tmp, f"in_{seconds}.mp3")
+        make_input(path, seconds, ["-c:a", "libmp3lame"])
+        files[f"bench_{seconds}"] = path
+
+    api = FakeBotAPI({})
+    await api.start()
+    from aiogram.client.telegram import TelegramAPIServer
+    main.bot.session.api = TelegramAPIServer.from_base(api.url)
+
+    started_day = datetime.date.today()
+    started = time.perf_counter()
+    await main.init_db()
+    init_db_s = time.perf_counter() - started
+    main.workspace.root = os.path.join(tmp, "workspace")
+    main.engine.start()
+    main.admission.start(main.engine.workers)
+
+    driver = HandlerDriver(base_user_id)
+    conversions = []
+    try:
+        for seconds in args.durations:
+            for fmt in args.formats:
+                # Har bir konvertatsiya - alohida file_unique_id (natija keshi ishlamasligi uchun)
+                jobs = []
+                for n in range(args.repeat):
+                    file_id = f"bench_{seconds}_{fmt}_{n}_{time.time_ns()}"
+                    api.files[file_id] = files[f"bench_{seconds}"]
+                    jobs.append(driver.conversion(file_id, seconds, fmt))
+                started = time.perf_counter()
+                await asyncio.gather(*jobs)
+                elapsed = time.perf_counter() - started
+                conversions.append({"format": fmt, "duration_bucket_s": seconds, "count": args.repeat,
+                                    "concurrency": args.repeat, "wall_s": round(elapsed, 3),
+                                    "conversions_per_s": round(args.repeat / elapsed, 3)})
+    finally:
+        await main.engine.stop()
+        async with main.db_pool.acquire() as conn:
+            await cleanup_bench_rows(conn, base_user_id, started_day)
+        await main.db_pool.close()
+        await main.bot.session.close()
+        await api.stop()
+
+    handlers = {name: {"count": len(v), "p50_ms": round(percentile(v, 50) * 1000, 2),
+                       "p99_ms": round(percentile(v, 99) * 1000, 2)}
+                for name, v in sorted(driver.latency.items())}
+    return init_db_s, handlers, conversions
+
+
+def cmd_handlers(args):
+    cold = cold_start(args.cold_runs)
+    with tempfile.TemporaryDirectory() as tmp:
+        init_db_s, handlers, conversions = asyncio.run(run_handlers(args, tmp))
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({
+        "benchmark": "handlers",
+        "cold_start": dict(cold, init_db_s=round(init_db_s, 3)),
+        "handlers": handlers,
+        "conversions": conversions,
+        "memory": {"peak_rss_mb": round(self_rss, 1), "peak_child_rss_mb": round(child_rss, 1)},
+    }, indent=2))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="AtomicAudioConvertorBot benchmarklari")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("transcode", help="ffmpeg va pydub backendlarini solishtirish")
+    p.add_argument("--backends", nargs="+", default=["pydub", "ffmpeg"])
+    p.add_argument("--formats", nargs="+", default=main.TARGET_FORMATS)
+    p.add_argument("--durations", nargs="+", type=int, default=[20, 120, 480])
+    p.add_argument("--inputs", nargs="+", default=["mp3", "wav"])
+    p.set_defaults(func=cmd_transcode)
+
+    p = sub.add_parser("flood", help="Flood detektori: xabar narxi va xotira")
+    p.add_argument("--users", type=int, default=100_000)
+    p.add_argument("--attackers", type=int, default=50)
+    p.add_argument("--messages", type=int, default=1_000_000)
+    p.add_argument("--duration", type=float, default=600.0, help="Virtual vaqt oralig'i, soniya")
+    p.add_argument("--capacity", type=int, default=main.FLOOD_CAPACITY)
+    p.set_defaults(func=cmd_flood)
+
+    p = sub.add_parser("batch", help="Bir marta dekodlab N formatga eksport vs N ta alohida konvertatsiya")
+    p.add_argument("--backends", nargs="+", default=["pydub", "ffmpeg"])
+    p.add_argument("--formats", nargs="+", default=main.TARGET_FORMATS)
+    p.add_argument("--durations", nargs="+", type=int, default=[120, 480])
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("handlers", help="Handler kechikishi, konvertatsiya/s, xotira va cold start (DATABASE_URL kerak)")
+    p.add_argument("--formats", nargs="+", default=main.TARGET_FORMATS)
+    p.add_argument("--durations", nargs="+", type=int, default=[20, 120, 480])
+    p.add_argument("--repeat", type=int, default=4, help="Har bir format/davomiylik uchun parallel konvertatsiyalar")
+    p.add_argument("--cold-runs", type=int, default=5)
+    p.set_defaults(func=cmd_handlers)
+
+    p = sub.add_parser("_batch")
+    p.add_argument("backend")
+    p.add_argument("in_path")
+    p.add_argument("out_dir")
+    p.add_argument("--formats", nargs="+", required=True)
+    p.add_argument("--codec")
+    p.set_defaults(func=cmd_batch_job)
+
+    p = sub.add_parser("_baseline")
+    p.set_defaults(func=lambda args: None)
+
+    p = sub.add_parser("_job")
+    p.add_argument("backend")
+    p.add_argument("in_path")
+    p.add_argument("out_path")
+    p.add_argument("fmt")
+    p.add_argument("--codec")
+    p.set_defaults(func=cmd_job)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main_cli()